@@ -1,103 +1,156 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import zipfile
+import hashlib
+import os
 import re
+import threading
 from io import BytesIO
-from PyPDF2 import PdfReader
+import pypdfium2 as pdfium
 from reportlab.lib.pagesizes import A4
 from reportlab.lib import colors
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet
-import pdfplumber
 from typing import Dict, List, Tuple, Optional
 import concurrent.futures
 
-# Extrai texto de bytes de PDF
+# Acelerador opcional: Hyperscan (Aho-Corasick vetorizado em C) para a varredura
+# das sentinelas. Sem ele, cai no re compilado — mesmo resultado, só mais lento.
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
+
+# Padrões compilados uma única vez no import (evita recompilação/lookup por chamada)
+_CNPJ_RE = re.compile(r'CNPJ:\s*(\d{2}\.\d{3}\.\d{3})\s*-\s*(.+)')
+_SPLIT_RE = re.compile(r'[,|\n]')
+
+# Sentinelas da análise de parcelamento, procuradas numa única varredura do texto
+_RF_TITLE = "Diagnóstico Fiscal na Receita Federal"
+_PGFN_TITLE = "Diagnóstico Fiscal na Procuradoria-Geral da Fazenda Nacional"
+_EM_PARC = "EM PARCELAMENTO"
+_PEND_PARC = "Pendência - Parcelamento"
+_SENTINELS = (_RF_TITLE, _PGFN_TITLE, _EM_PARC, _PEND_PARC)
+_ID_RF_TITLE, _ID_PGFN_TITLE, _ID_EM_PARC, _ID_PEND_PARC = range(len(_SENTINELS))
+_SENTINELS_RE = re.compile("|".join(map(re.escape, _SENTINELS)))
+_SENTINEL_IDS = {sentinel: i for i, sentinel in enumerate(_SENTINELS)}
+
+# Qualquer falha na montagem do banco (expressão rejeitada, plataforma sem
+# suporte) degrada para o caminho do re em vez de derrubar o app no import.
+# Sem HS_FLAG_UTF8: o casamento byte a byte sobre o texto codificado em UTF-8
+# produz os mesmos hits das sentinelas acentuadas que o fallback em re.
+_HS_DB = None
+if hyperscan is not None:
+    try:
+        _HS_DB = hyperscan.Database()
+        _HS_DB.compile(
+            expressions=[re.escape(s).encode("utf-8") for s in _SENTINELS],
+            ids=list(range(len(_SENTINELS))),
+            flags=[hyperscan.HS_FLAG_SOM_LEFTMOST] * len(_SENTINELS),
+        )
+    except Exception:
+        _HS_DB = None
+
+# Um Scratch por thread: a API do Hyperscan proíbe varreduras concorrentes
+# sobre o mesmo scratch, e _sentinel_hits roda nos workers do pool
+_HS_SCRATCH = threading.local()
+
+
+def _sentinel_hits(text: str) -> List[int]:
+    """Devolve os ids das sentinelas encontradas no texto, em ordem de posição."""
+    if _HS_DB is not None:
+        scratch = getattr(_HS_SCRATCH, 'scratch', None)
+        if scratch is None:
+            scratch = hyperscan.Scratch(_HS_DB)
+            _HS_SCRATCH.scratch = scratch
+        hits: List[Tuple[int, int]] = []
+
+        def _on_match(id_, start, end, flags, context):
+            hits.append((start, id_))
+
+        _HS_DB.scan(text.encode("utf-8"), match_event_handler=_on_match, scratch=scratch)
+        # O Hyperscan reporta na ordem do fim do match; reordena pelo início
+        hits.sort()
+        return [id_ for _, id_ in hits]
+    return [_SENTINEL_IDS[match.group()] for match in _SENTINELS_RE.finditer(text)]
+
+# Extrai texto de bytes de PDF (PDFium em C++, bem mais rápido que extração em Python puro)
 def extract_text_from_bytes(file_bytes: bytes) -> str:
-    reader = PdfReader(BytesIO(file_bytes))
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text() or ""
-        text += "\n"
-    return text
+    pdf = pdfium.PdfDocument(file_bytes)
+    return "\n".join(page.get_textpage().get_text_range() for page in pdf)
 
 # Função para extrair nome da empresa do PDF
 def extract_company_name_from_bytes(file_bytes: bytes) -> str:
     """
     Extrai o nome da empresa do PDF, buscando o padrão 'CNPJ: XX.XXX.XXX - NOME DA EMPRESA'.
     """
-    with pdfplumber.open(BytesIO(file_bytes)) as pdf:
-        for page in pdf.pages[:2]:
-            text = page.extract_text() or ""
-            # Procura o padrão CNPJ seguido do nome da empresa
-            match = re.search(r'CNPJ:\s*(\d{2}\.\d{3}\.\d{3})\s*-\s*(.+)', text)
-            if match:
-                return match.group(2).strip()
+    pdf = pdfium.PdfDocument(file_bytes)
+    for i in range(min(2, len(pdf))):
+        text = pdf[i].get_textpage().get_text_range()
+        # Procura o padrão CNPJ seguido do nome da empresa
+        match = _CNPJ_RE.search(text)
+        if match:
+            return match.group(2).strip()
     return None
 
+def _advance_parcelamento(sentinel_ids, rf_seen: bool, pgfn_seen: bool,
+                          rf_parc: bool, pgfn_parc: bool) -> Tuple[bool, bool, bool, bool]:
+    """Avança a máquina de estados da análise com as sentinelas de um trecho."""
+    for sentinel_id in sentinel_ids:
+        if sentinel_id == _ID_RF_TITLE:
+            rf_seen = True
+        elif sentinel_id == _ID_PGFN_TITLE:
+            pgfn_seen = True
+        elif sentinel_id == _ID_EM_PARC:
+            # Conta apenas dentro da seção RF (entre os dois títulos)
+            if rf_seen and not pgfn_seen:
+                rf_parc = True
+        elif sentinel_id == _ID_PEND_PARC:
+            if pgfn_seen:
+                pgfn_parc = True
+    return rf_seen, pgfn_seen, rf_parc, pgfn_parc
+
 # Analisa se há parcelamento nas seções Receita Federal e PGFN
 def analyze_text(text: str) -> tuple[bool, bool]:
-    rf_title = "Diagnóstico Fiscal na Receita Federal"
-    pgfn_title = "Diagnóstico Fiscal na Procuradoria-Geral da Fazenda Nacional"
-    rf_start = text.find(rf_title)
-    pgfn_start = text.find(pgfn_title)
-    rf_section = text[rf_start:pgfn_start] if rf_start != -1 and pgfn_start != -1 else ""
-    pgfn_section = text[pgfn_start:] if pgfn_start != -1 else ""
-
-    rf_parc = "EM PARCELAMENTO" in rf_section
-    if not rf_parc and "BASE INDISPONÍVEL" in rf_section and "Parcelamento" in rf_section:
-        rf_parc = False
-    pgfn_parc = "Pendência - Parcelamento" in pgfn_section
-    if not pgfn_parc and "Não foram detectadas pendências/exigibilidades suspensas" in pgfn_section:
-        pgfn_parc = False
-    return rf_parc, pgfn_parc
-
-# Cache para armazenar resultados processados
-@st.cache_data
+    # Uma única varredura do texto: as sentinelas chegam em ordem de posição,
+    # então basta acompanhar em qual seção estamos, sem fatiar o texto
+    rf_seen, pgfn_seen, rf_parc, pgfn_parc = _advance_parcelamento(
+        _sentinel_hits(text), False, False, False, False)
+    # A seção RF só existe quando os dois títulos estão presentes
+    return rf_parc and pgfn_seen, pgfn_parc
+
+# Worker executado nos processos do pool: sem cache e sem chamadas ao Streamlit,
+# para ser picklável e não tocar no estado da sessão. Erros propagam pela future
+# e são tratados no processo principal.
 def process_pdf(file_bytes: bytes) -> Tuple[Optional[str], bool, bool]:
     """
     Processa um PDF e retorna o nome da empresa e status de parcelamento.
     """
-    try:
-        # Extrai texto do PDF
-        reader = PdfReader(BytesIO(file_bytes))
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() or ""
-            text += "\n"
-
-        # Extrai nome da empresa
-        empresa = None
-        with pdfplumber.open(BytesIO(file_bytes)) as pdf:
-            for page in pdf.pages[:2]:
-                text_pdf = page.extract_text() or ""
-                match = re.search(r'CNPJ:\s*(\d{2}\.\d{3}\.\d{3})\s*-\s*(.+)', text_pdf)
-                if match:
-                    empresa = match.group(2).strip()
-                    break
-
-        # Analisa parcelamento
-        rf_title = "Diagnóstico Fiscal na Receita Federal"
-        pgfn_title = "Diagnóstico Fiscal na Procuradoria-Geral da Fazenda Nacional"
-        
-        rf_start = text.find(rf_title)
-        pgfn_start = text.find(pgfn_title)
-        
-        rf_section = text[rf_start:pgfn_start] if rf_start != -1 and pgfn_start != -1 else ""
-        pgfn_section = text[pgfn_start:] if pgfn_start != -1 else ""
-
-        rf_parc = "EM PARCELAMENTO" in rf_section
-        if not rf_parc and "BASE INDISPONÍVEL" in rf_section and "Parcelamento" in rf_section:
-            rf_parc = False
-            
-        pgfn_parc = "Pendência - Parcelamento" in pgfn_section
-        if not pgfn_parc and "Não foram detectadas pendências/exigibilidades suspensas" in pgfn_section:
-            pgfn_parc = False
-
-        return empresa, rf_parc, pgfn_parc
-    except Exception as e:
-        st.error(f"Erro ao processar PDF: {str(e)}")
-        return None, False, False
+    # Extrai página a página e interrompe assim que a análise está decidida:
+    # os diagnósticos costumam estar nas primeiras páginas e o resto do
+    # relatório não muda o resultado
+    pdf = pdfium.PdfDocument(file_bytes)
+    empresa = None
+    rf_seen = pgfn_seen = rf_parc = pgfn_parc = False
+    for i, page in enumerate(pdf):
+        page_text = page.get_textpage().get_text_range()
+
+        # Nome da empresa só é procurado nas duas primeiras páginas
+        if empresa is None and i < 2:
+            match = _CNPJ_RE.search(page_text)
+            if match:
+                empresa = match.group(2).strip()
+
+        rf_seen, pgfn_seen, rf_parc, pgfn_parc = _advance_parcelamento(
+            _sentinel_hits(page_text), rf_seen, pgfn_seen, rf_parc, pgfn_parc)
+
+        # Tudo decidido positivo e janela do CNPJ esgotada: páginas restantes
+        # não alteram o resultado
+        if i >= 1 and pgfn_seen and rf_parc and pgfn_parc:
+            break
+
+    return empresa, rf_parc and pgfn_seen, pgfn_parc
 
 # Gera PDF resumo da análise
 def generate_pdf(results: List[Dict]) -> BytesIO:
@@ -110,15 +163,13 @@ def generate_pdf(results: List[Dict]) -> BytesIO:
     elems.append(Paragraph("Relatório de Parcelamento", styles['Heading1']))
     elems.append(Spacer(1, 12))
 
-    data = [["Empresa", "Parcelamento RF", "Parcelamento PGFN"]]
-    for r in results:
-        data.append([
-            r["empresa"],
-            "Sim" if r["rf"] else "Não",
-            "Sim" if r["pgfn"] else "Não"
-        ])
+    data = [["Empresa", "Parcelamento RF", "Parcelamento PGFN"]] + [
+        (r["empresa"], "Sim" if r["rf"] else "Não", "Sim" if r["pgfn"] else "Não")
+        for r in results
+    ]
 
-    table = Table(data, repeatRows=1)
+    # colWidths explícito pula a passada de auto-ajuste de largura do ReportLab
+    table = Table(data, repeatRows=1, splitByRow=1, colWidths=[300, 80, 80])
     table.setStyle(TableStyle([
         ('BACKGROUND', (0,0), (-1,0), colors.darkgray),
         ('TEXTCOLOR', (0,0), (-1,0), colors.whitesmoke),
@@ -133,18 +184,6 @@ def generate_pdf(results: List[Dict]) -> BytesIO:
     buffer.seek(0)
     return buffer
 
-def filter_results(results: List[Dict], search_terms: List[str]) -> List[Dict]:
-    """Filtra resultados baseado em múltiplos termos de busca."""
-    if not search_terms:
-        return results
-    
-    filtered = []
-    for result in results:
-        empresa = result["empresa"].lower()
-        if any(term.lower() in empresa for term in search_terms):
-            filtered.append(result)
-    return filtered
-
 def processamento():
     st.title("Processador e Analisador de Situação Fiscal")
     st.session_state.setdefault('dados_processados', None)
@@ -163,80 +202,126 @@ def processamento():
     )
     search_terms = []
     if search_input:
-        terms = re.split(r'[,|\n]', search_input)
+        terms = _SPLIT_RE.split(search_input)
         search_terms = [term.strip() for term in terms if term.strip()]
     zip_file = st.file_uploader("ZIP de relatórios PDF", type="zip")
     if zip_file:
-        with zipfile.ZipFile(BytesIO(zip_file.getvalue())) as zf:
-            all_results = []
-            matched_files = []
+        zip_bytes = zip_file.getvalue()
+        with zipfile.ZipFile(BytesIO(zip_bytes)) as zf:
+            # Listas paralelas (SoA) em vez de lista de dicts: sem indireção
+            # por linha e a montagem do DataFrame no final é colunar
+            empresas = []
+            rfs = []
+            pgfns = []
+            # Apenas metadados: nome renomeado -> nome original no zip de
+            # entrada (dict para busca O(1) no dashboard)
+            matched_files = {}
             unmatched_files = []
             pdf_files = [info for info in zf.infolist() if info.filename.lower().endswith('.pdf')]
             total_pdfs = len(pdf_files)
             progress_bar = st.progress(0, text="Processando PDFs...")
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future_to_file = {
-                    executor.submit(process_pdf, zf.read(info.filename)): info.filename
-                    for info in pdf_files
-                }
+            # Zip de saída aberto desde o início: cada PDF é gravado assim que
+            # classificado, sem acumular todos os bytes em listas. ZIP_STORED
+            # porque PDF já é comprimido — recomprimir só gastaria CPU.
+            out_buffer = BytesIO()
+            zout = zipfile.ZipFile(out_buffer, 'w', zipfile.ZIP_STORED)
+            # Cache de resultados por hash do conteúdo: guarda só a tupla
+            # (empresa, rf, pgfn) por digest de 16 bytes, então re-uploads do
+            # mesmo PDF não pagam o parsing de novo
+            pdf_cache = st.session_state.setdefault('pdf_cache', {})
+
+            def registrar_resultado(filename, file_bytes, resultado):
+                empresa, rf_parc, pgfn_parc = resultado
+                if empresa:
+                    empresas.append(empresa)
+                    rfs.append(rf_parc)
+                    pgfns.append(pgfn_parc)
+                    new_name = f"{empresa}.pdf"
+                    zout.writestr(f"renomeados/{new_name}", file_bytes)
+                    matched_files[new_name] = filename
+                else:
+                    zout.writestr(f"nao_encontrados/{filename}", file_bytes)
+                    unmatched_files.append(filename)
+
+            # Processos, não threads: o PDFium não é thread-safe (a própria
+            # documentação do pypdfium2 proíbe chamadas simultâneas, mesmo em
+            # documentos distintos), então cada worker precisa do seu processo
+            # para paralelizar o parsing com segurança.
+            with concurrent.futures.ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, 8)) as executor:
+                # Lê cada PDF do zip uma única vez; só vai ao pool quem não
+                # está no cache
+                future_to_file = {}
                 processed = 0
+                for info in pdf_files:
+                    file_bytes = zf.read(info.filename)
+                    pdf_hash = hashlib.blake2b(file_bytes, digest_size=16).hexdigest()
+                    resultado = pdf_cache.get(pdf_hash)
+                    if resultado is not None:
+                        registrar_resultado(info.filename, file_bytes, resultado)
+                        processed += 1
+                        progress_bar.progress(processed / total_pdfs, text=f"Processando PDFs... ({processed}/{total_pdfs})")
+                    else:
+                        future = executor.submit(process_pdf, file_bytes)
+                        future_to_file[future] = (info.filename, file_bytes, pdf_hash)
                 for future in concurrent.futures.as_completed(future_to_file):
-                    filename = future_to_file[future]
+                    filename, file_bytes, pdf_hash = future_to_file[future]
                     try:
-                        empresa, rf_parc, pgfn_parc = future.result()
-                        if empresa:
-                            result = {
-                                "empresa": empresa,
-                                "rf": rf_parc,
-                                "pgfn": pgfn_parc,
-                                "filename": filename
-                            }
-                            all_results.append(result)
-                            file_bytes = zf.read(filename)
-                            new_name = f"{empresa}.pdf"
-                            matched_files.append((new_name, file_bytes))
-                        else:
-                            unmatched_files.append((filename, zf.read(filename)))
+                        resultado = future.result()
+                        pdf_cache[pdf_hash] = resultado
+                        registrar_resultado(filename, file_bytes, resultado)
                     except Exception as e:
                         st.error(f"Erro ao processar {filename}: {str(e)}")
+                        # PDF que falhou ainda vai para nao_encontrados/, como
+                        # um sem empresa — o zip de saída contém todos os
+                        # arquivos enviados (falhas não entram no cache)
+                        registrar_resultado(filename, file_bytes, (None, False, False))
                     processed += 1
                     progress_bar.progress(processed / total_pdfs, text=f"Processando PDFs... ({processed}/{total_pdfs})")
             progress_bar.empty()
-            # Salva resultados na sessão para uso no dashboard
+            zout.close()
+            out_buffer.seek(0)
+            # Flags rf/pgfn empacotadas num uint8 por linha (bit 0 = RF,
+            # bit 1 = PGFN): filtros e KPIs do dashboard viram operações de
+            # máscara inteira e um único np.bincount
+            rf_arr = np.fromiter(rfs, dtype=bool, count=len(rfs))
+            pgfn_arr = np.fromiter(pgfns, dtype=bool, count=len(pgfns))
+            codes = rf_arr.astype(np.uint8) | (pgfn_arr.astype(np.uint8) << 1)
+            # DataFrame montado uma única vez, em colunas, a partir das listas
+            # paralelas — o dashboard usa este mesmo frame, sem reconstrução
+            df = pd.DataFrame({
+                "Empresa": empresas,
+                "Parcelamento RF": pd.Categorical(
+                    np.where(rf_arr, "Sim", "Não"), categories=["Sim", "Não"]),
+                "Parcelamento PGFN": pd.Categorical(
+                    np.where(pgfn_arr, "Sim", "Não"), categories=["Sim", "Não"]),
+            })
+            # Salva na sessão apenas o frame + metadados + o zip original
+            # (para o dashboard reabrir e extrair um PDF específico sob demanda)
             st.session_state['dados_processados'] = {
-                'all_results': all_results,
+                'df': df,
+                'codes': codes,
                 'matched_files': matched_files,
                 'unmatched_files': unmatched_files,
-                'search_terms': search_terms
+                'search_terms': search_terms,
+                'zip_bytes': zip_bytes
             }
             # Exibe resultados como antes
             if search_terms:
-                filtered_results = filter_results(all_results, search_terms)
-                if filtered_results:
-                    df = pd.DataFrame([{
-                        "Empresa": r["empresa"],
-                        "Parcelamento RF": "Sim" if r["rf"] else "Não",
-                        "Parcelamento PGFN": "Sim" if r["pgfn"] else "Não"
-                    } for r in filtered_results])
-                    st.dataframe(df)
+                # Filtro vetorizado: uma alternação de termos escapados roda em
+                # C dentro do pandas, em vez de loop Python termo a termo
+                mask = df["Empresa"].str.contains(
+                    "|".join(map(re.escape, search_terms)),
+                    case=False, regex=True, na=False
+                )
+                df_filtrado = df[mask]
+                if not df_filtrado.empty:
+                    st.dataframe(df_filtrado)
                 else:
                     st.warning(f"Nenhuma empresa encontrada com os termos: {', '.join(search_terms)}")
             else:
                 st.subheader("Todos os Resultados")
-                df = pd.DataFrame([{
-                    "Empresa": r["empresa"],
-                    "Parcelamento RF": "Sim" if r["rf"] else "Não",
-                    "Parcelamento PGFN": "Sim" if r["pgfn"] else "Não"
-                } for r in all_results])
                 st.dataframe(df)
-            # Download ZIP organizado
-            out_buffer = BytesIO()
-            with zipfile.ZipFile(out_buffer, 'w') as zout:
-                for fname, data in matched_files:
-                    zout.writestr(f"renomeados/{fname}", data)
-                for orig, data in unmatched_files:
-                    zout.writestr(f"nao_encontrados/{orig}", data)
-            out_buffer.seek(0)
+            # Download ZIP organizado (já montado durante o processamento)
             st.download_button(
                 "Download de todas as empresas",
                 data=out_buffer,
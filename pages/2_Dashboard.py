@@ -1,6 +1,8 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.express as px
+import zipfile
 from io import BytesIO
 
 st.set_page_config(page_title="Dashboard Fiscal", layout="wide")
@@ -14,17 +16,13 @@ Utilize os filtros abaixo para refinar a visualização dos dados.
 
 dados = st.session_state.get('dados_processados', None)
 
-if not dados or not dados.get('all_results'):
+if not dados or dados.get('df') is None or dados['df'].empty:
     st.warning("Nenhum dado processado encontrado. Por favor, faça o upload e processamento dos PDFs na página inicial.")
     st.stop()
 
-all_results = dados['all_results']
-matched_files = dados.get('matched_files', [])
-df = pd.DataFrame([{
-    'Empresa': r['empresa'],
-    'Parcelamento RF': 'Sim' if r['rf'] else 'Não',
-    'Parcelamento PGFN': 'Sim' if r['pgfn'] else 'Não'
-} for r in all_results])
+# O frame já vem pronto do processamento — nenhuma reconstrução por rerun
+df = dados['df']
+matched_files = dados.get('matched_files', {})
 
 # Busca e download de PDF por empresa
 st.markdown("---")
@@ -32,13 +30,14 @@ st.subheader("Buscar e baixar PDF de uma empresa específica")
 empresas = sorted(df['Empresa'].unique())
 empresa_selecionada = st.selectbox("Selecione a empresa para baixar o PDF renomeado:", ["(Selecione)"] + empresas)
 if empresa_selecionada and empresa_selecionada != "(Selecione)":
-    # Procurar o PDF renomeado correspondente
+    # Procurar o PDF renomeado correspondente e extraí-lo do zip original
+    # sob demanda (a sessão guarda apenas os nomes, não os bytes)
     nome_pdf = f"{empresa_selecionada}.pdf"
     pdf_bytes = None
-    for fname, fbytes in matched_files:
-        if fname == nome_pdf:
-            pdf_bytes = fbytes
-            break
+    orig_name = matched_files.get(nome_pdf)
+    if orig_name is not None:
+        with zipfile.ZipFile(BytesIO(dados['zip_bytes'])) as zf:
+            pdf_bytes = zf.read(orig_name)
     if pdf_bytes:
         st.success(f"PDF encontrado: {nome_pdf}")
         st.download_button(
@@ -62,19 +61,27 @@ with st.expander("Filtros avançados", expanded=False):
     with col3:
         status_pgfn = st.selectbox("Parcelamento PGFN", options=["Todos", "Sim", "Não"])
 
-# Aplicar filtros
-df_filtrado = df[df['Empresa'].isin(filtro_empresas)]
+# Aplicar filtros: as flags empacotadas (bit 0 = RF, bit 1 = PGFN) permitem
+# filtrar Sim/Não com operações inteiras, sem comparação de strings
+codes = dados['codes']
+# (sem &= in-place: o to_numpy() do pandas com copy-on-write devolve um
+# array somente-leitura)
+mask = df['Empresa'].isin(filtro_empresas).to_numpy()
 if status_rf != "Todos":
-    df_filtrado = df_filtrado[df_filtrado['Parcelamento RF'] == status_rf]
+    mask = mask & ((codes & 1) == (1 if status_rf == "Sim" else 0))
 if status_pgfn != "Todos":
-    df_filtrado = df_filtrado[df_filtrado['Parcelamento PGFN'] == status_pgfn]
+    mask = mask & ((codes >> 1) == (1 if status_pgfn == "Sim" else 0))
+df_filtrado = df[mask]
+codes_filtrados = codes[mask]
 
-# KPIs
+# KPIs: um único bincount sobre os códigos filtrados entrega as quatro
+# contagens (nenhum, só RF, só PGFN, ambos) de uma vez
+counts = np.bincount(codes_filtrados, minlength=4)
 col1, col2, col3, col4 = st.columns(4)
-total_empresas = len(df_filtrado)
-rf_sim = (df_filtrado['Parcelamento RF'] == 'Sim').sum()
-pgfn_sim = (df_filtrado['Parcelamento PGFN'] == 'Sim').sum()
-ambos_sim = ((df_filtrado['Parcelamento RF'] == 'Sim') & (df_filtrado['Parcelamento PGFN'] == 'Sim')).sum()
+total_empresas = codes_filtrados.size
+rf_sim = int(counts[1] + counts[3])
+pgfn_sim = int(counts[2] + counts[3])
+ambos_sim = int(counts[3])
 col1.metric("Total de Empresas Filtradas", total_empresas)
 col2.metric("Parcelamento RF (Sim)", rf_sim)
 col3.metric("Parcelamento PGFN (Sim)", pgfn_sim)
@@ -82,31 +89,60 @@ col4.metric("Parcelamento em Ambos", ambos_sim)
 
 st.markdown("---")
 
-# Gráficos
+# Gráficos: as figuras são cacheadas pela distribuição de categorias (uma
+# tupla minúscula), então só são reconstruídas — e re-serializadas para JSON —
+# quando um filtro de fato muda a distribuição
+@st.cache_data
+def _pie_distribuicao(counts, column, title, colormap):
+    dist = pd.DataFrame(list(counts), columns=[column, 'Empresas'])
+    return px.pie(dist, names=column, values='Empresas', title=title, color=column, color_discrete_map=colormap)
+
+@st.cache_data
+def _bar_ambos(empresas_tuple):
+    return px.bar(pd.DataFrame({'Empresa': list(empresas_tuple)}), x='Empresa', title='Empresas com Parcelamento em RF e PGFN', color='Empresa', color_discrete_sequence=px.colors.qualitative.Pastel)
+
 colg1, colg2 = st.columns(2)
 with colg1:
-    fig_rf = px.pie(df_filtrado, names='Parcelamento RF', title='Distribuição Parcelamento Receita Federal', color='Parcelamento RF', color_discrete_map={"Sim": "#2ecc71", "Não": "#e74c3c"})
+    fig_rf = _pie_distribuicao(
+        (('Sim', rf_sim), ('Não', total_empresas - rf_sim)),
+        'Parcelamento RF', 'Distribuição Parcelamento Receita Federal',
+        {"Sim": "#2ecc71", "Não": "#e74c3c"})
     st.plotly_chart(fig_rf, use_container_width=True)
 with colg2:
-    fig_pgfn = px.pie(df_filtrado, names='Parcelamento PGFN', title='Distribuição Parcelamento PGFN', color='Parcelamento PGFN', color_discrete_map={"Sim": "#2980b9", "Não": "#f1c40f"})
+    fig_pgfn = _pie_distribuicao(
+        (('Sim', pgfn_sim), ('Não', total_empresas - pgfn_sim)),
+        'Parcelamento PGFN', 'Distribuição Parcelamento PGFN',
+        {"Sim": "#2980b9", "Não": "#f1c40f"})
     st.plotly_chart(fig_pgfn, use_container_width=True)
 
-# Gráfico de barras - Empresas com parcelamento em ambos
-df_ambos = df_filtrado[(df_filtrado['Parcelamento RF'] == 'Sim') & (df_filtrado['Parcelamento PGFN'] == 'Sim')]
+# Gráfico de barras - Empresas com parcelamento em ambos (código 3 = RF e PGFN)
+df_ambos = df_filtrado[codes_filtrados == 3]
 if not df_ambos.empty:
     st.markdown("#### Empresas com Parcelamento em RF e PGFN")
-    fig_ambos = px.bar(df_ambos, x='Empresa', title='Empresas com Parcelamento em RF e PGFN', color='Empresa', color_discrete_sequence=px.colors.qualitative.Pastel)
+    fig_ambos = _bar_ambos(tuple(df_ambos['Empresa']))
     st.plotly_chart(fig_ambos, use_container_width=True)
 
 st.markdown("---")
 
-# Exportação Excel
-excel_buffer = BytesIO()
-df_filtrado.to_excel(excel_buffer, index=False)
-excel_buffer.seek(0)
+# Exportações pesadas ficam atrás de st.cache_data, chaveadas pelas linhas
+# filtradas: trocar um filtro só regenera os arquivos se o conteúdo mudou,
+# em vez de remontar Excel + PDF a cada rerun
+registros = tuple(df_filtrado.itertuples(index=False, name=None))
+colunas = tuple(df_filtrado.columns)
+
+# Exportação Excel com xlsxwriter, mais rápido que o openpyxl nesta forma de
+# tabela. Sem constant_memory: o to_excel do pandas escreve em ordem de coluna
+# e o modo streaming descarta células de linhas já despejadas
+@st.cache_data
+def _gerar_excel(records, columns):
+    excel_buffer = BytesIO()
+    with pd.ExcelWriter(excel_buffer, engine='xlsxwriter') as writer:
+        pd.DataFrame(list(records), columns=list(columns)).to_excel(writer, index=False)
+    return excel_buffer.getvalue()
+
 st.download_button(
     label="Exportar para Excel",
-    data=excel_buffer,
+    data=_gerar_excel(registros, colunas),
     file_name="dashboard_situacao_fiscal.xlsx",
     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
 )
@@ -117,15 +153,19 @@ from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph,
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet
 
-def gerar_pdf_dashboard(df):
+@st.cache_data
+def _gerar_pdf_dashboard(records, columns):
     buffer = BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=A4)
     styles = getSampleStyleSheet()
     elems = []
     elems.append(Paragraph("Relatório de Parcelamento - Dashboard", styles['Heading1']))
     elems.append(Spacer(1, 12))
-    data = [list(df.columns)] + df.values.tolist()
-    table = Table(data, repeatRows=1)
+    # As linhas já são tuplas prontas — a Table aceita sequências direto, sem
+    # conversão por linha. colWidths explícito pula a passada de auto-ajuste
+    # de largura do ReportLab, que é O(linhas x colunas)
+    data = [list(columns)] + list(records)
+    table = Table(data, repeatRows=1, splitByRow=1, colWidths=[300, 80, 80])
     table.setStyle(TableStyle([
         ('BACKGROUND', (0,0), (-1,0), colors.darkgray),
         ('TEXTCOLOR', (0,0), (-1,0), colors.whitesmoke),
@@ -138,12 +178,11 @@ def gerar_pdf_dashboard(df):
     elems.append(table)
     doc.build(elems)
     buffer.seek(0)
-    return buffer
+    return buffer.getvalue()
 
-pdf_buffer = gerar_pdf_dashboard(df_filtrado)
 st.download_button(
     label="Exportar para PDF (tabela)",
-    data=pdf_buffer,
+    data=_gerar_pdf_dashboard(registros, colunas),
     file_name="dashboard_situacao_fiscal.pdf",
     mime="application/pdf"
 )